@@ -0,0 +1,68 @@
+"""Numba-compiled kernels for lane detection.
+
+Numba is an optional dependency (``pip install lane_detection[jit]``);
+HAVE_NUMBA tells callers whether the compiled kernels are available.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+def _calc_lane_lines(segments, min_slope):
+    """Average the slope and intercept of the left and right lane segments.
+    
+    Works in float32 like the NumPy path of calculate_lane_lines, so both
+    give the same lane lines.
+    
+    Args:
+        segments: int32 array of shape (N, 4) holding [x1, y1, x2, y2]
+        min_slope: Segments with abs(slope) at or below this are ignored
+    
+    Returns:
+        Tuple (means, counts): means holds [left_slope, left_intercept,
+        right_slope, right_intercept] and counts the number of left and
+        right segments; the means of a lane without segments are zero
+    """
+    threshold = np.float32(min_slope)
+    means = np.zeros(4, dtype=np.float32)
+    counts = np.zeros(2, dtype=np.int64)
+    
+    for i in range(segments.shape[0]):
+        x1 = np.float32(segments[i, 0])
+        y1 = np.float32(segments[i, 1])
+        x2 = np.float32(segments[i, 2])
+        y2 = np.float32(segments[i, 3])
+        if x1 == x2:  # Skip vertical lines
+            continue
+        
+        slope = (y2 - y1) / (x2 - x1)
+        intercept = y1 - slope * x1
+        
+        # Categorize lines by slope
+        if slope < -threshold:  # Left line
+            means[0] += slope
+            means[1] += intercept
+            counts[0] += 1
+        elif slope > threshold:  # Right line
+            means[2] += slope
+            means[3] += intercept
+            counts[1] += 1
+    
+    for side in range(2):
+        if counts[side]:
+            means[2 * side] /= np.float32(counts[side])
+            means[2 * side + 1] /= np.float32(counts[side])
+    
+    return means, counts
+
+
+if HAVE_NUMBA:
+    calc_lane_lines_nb = numba.njit(cache=True)(_calc_lane_lines)
+else:
+    calc_lane_lines_nb = None
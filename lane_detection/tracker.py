@@ -0,0 +1,68 @@
+"""Reuse of lane detections across consecutive video frames."""
+
+import numpy as np
+
+from lane_detection.utils import canny, downscale, gaussian_blur, grayscale, region_of_interest, scale_vertices
+
+
+class LaneTracker:
+    """Run lane detection every few frames and reuse the result in between.
+    
+    Lane geometry changes slowly at video frame rates, so the full detection
+    only runs once every `interval` frames. A cheap scene check (the edge
+    density of a Canny pass on a small copy of the frame) forces detection
+    early when the view changes abruptly.
+    """
+    
+    def __init__(self, detect, interval=3, vertices=None, change_threshold=0.5, check_scale=0.25):
+        """Initialize the tracker.
+        
+        Args:
+            detect: Callable taking a frame and returning its lanes
+            interval: Run full detection once every this many frames
+            vertices: Optional region of interest for the scene check
+            change_threshold: Relative change in edge density that forces detection
+            check_scale: Downscale factor used for the scene check
+        """
+        self._detect = detect
+        self.interval = interval
+        self.change_threshold = change_threshold
+        self.check_scale = check_scale
+        self._vertices = None if vertices is None else scale_vertices(vertices, check_scale)
+        self._frames_left = 0
+        self._last_lanes = None
+        self._last_density = None
+    
+    def _edge_density(self, frame):
+        """Fraction of edge pixels in a downscaled copy of the frame."""
+        edges = canny(gaussian_blur(grayscale(downscale(frame, self.check_scale))))
+        if self._vertices is not None:
+            edges = region_of_interest(edges, self._vertices)
+        return np.count_nonzero(edges) / edges.size
+    
+    def _scene_changed(self, density):
+        """Check whether the edge density moved too far from the last detection."""
+        change = abs(density - self._last_density)
+        return change > self.change_threshold * max(self._last_density, 1e-6)
+    
+    def detect(self, frame):
+        """Return the lanes for a frame, detecting only when needed.
+        
+        Args:
+            frame: Input frame (BGR color space)
+        
+        Returns:
+            Lanes from the wrapped detect callable, possibly from an earlier frame
+        """
+        if self.interval <= 1:
+            return self._detect(frame)
+        
+        density = self._edge_density(frame)
+        if self._frames_left > 0 and not self._scene_changed(density):
+            self._frames_left -= 1
+            return self._last_lanes
+        
+        self._last_lanes = self._detect(frame)
+        self._last_density = density
+        self._frames_left = self.interval - 1
+        return self._last_lanes
@@ -1,64 +1,114 @@
 """Utility functions for lane detection."""
 
+import functools
+
 import cv2
 import numpy as np
 
+from lane_detection import _jit
+
 
-def grayscale(img):
+def grayscale(img, dst=None):
     """Convert image to grayscale.
     
+    Images that are already single channel are returned unchanged, so frames
+    decoded or converted to grayscale upstream skip a second conversion.
+    
     Args:
-        img: Input image (BGR color space)
+        img: Input image (BGR color space, or grayscale)
+        dst: Optional preallocated output image to write into
         
     Returns:
         Grayscale image
     """
-    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if isinstance(img, np.ndarray) and img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=dst)
 
 
-def gaussian_blur(img, kernel_size=5):
+def downscale(img, scale=0.5):
+    """Shrink an image before edge and line detection.
+    
+    Lane markings are coarse features that survive downscaling, and halving
+    each side cuts the pixels going through blur, Canny and Hough by 4x.
+    
+    Args:
+        img: Input image
+        scale: Factor applied to both image dimensions
+        
+    Returns:
+        Resized image
+    """
+    if scale == 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def scale_vertices(vertices, scale):
+    """Scale region of interest vertices to match a resized image.
+    
+    Args:
+        vertices: Array of vertices defining the region of interest
+        scale: Factor the image was resized by
+        
+    Returns:
+        Scaled int32 vertices
+    """
+    return np.round(np.asarray(vertices) * scale).astype(np.int32)
+
+
+def gaussian_blur(img, kernel_size=5, dst=None):
     """Apply Gaussian blur to reduce noise.
     
     Args:
         img: Input image
         kernel_size: Size of Gaussian kernel
+        dst: Optional preallocated output image to write into
         
     Returns:
         Blurred image
     """
-    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
+    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0, dst=dst)
 
 
-def canny(img, low_threshold=50, high_threshold=150):
+def canny(img, low_threshold=50, high_threshold=150, dst=None):
     """Apply Canny edge detection algorithm.
     
     Args:
         img: Input image (grayscale)
         low_threshold: Lower threshold for edge detection
         high_threshold: Upper threshold for edge detection
+        dst: Optional preallocated output image to write into
         
     Returns:
         Image with detected edges
     """
-    return cv2.Canny(img, low_threshold, high_threshold)
+    return cv2.Canny(img, low_threshold, high_threshold, edges=dst)
 
 
-def region_of_interest(img, vertices):
-    """Mask the image to only include the region of interest.
+@functools.lru_cache(maxsize=8)
+def _roi_mask(shape, dtype, vertices_bytes):
+    """Build the region of interest mask for an image shape and polygon.
+    
+    The ROI polygon and frame size are fixed for a whole video, so masks are
+    cached and the rasterization happens once instead of on every frame.
     
     Args:
-        img: Input image
-        vertices: Array of vertices defining the region of interest
+        shape: Shape of the image to be masked
+        dtype: Data type of the image to be masked
+        vertices_bytes: Raw int32 bytes of the region of interest vertices
         
     Returns:
-        Masked image showing only the region of interest
+        Read-only mask image
     """
+    vertices = np.frombuffer(vertices_bytes, dtype=np.int32).reshape(-1, 2)
+    
     # Create an empty mask with the same shape as the input image
-    mask = np.zeros_like(img)
+    mask = np.zeros(shape, dtype=dtype)
     
     # Define the number of channels in the mask
-    if len(img.shape) > 2:
-        channel_count = img.shape[2]  # Color image
+    if len(shape) > 2:
+        channel_count = shape[2]  # Color image
         ignore_mask_color = (255,) * channel_count
     else:
         ignore_mask_color = 255  # Grayscale image
@@ -66,12 +116,36 @@ def region_of_interest(img, vertices):
     # Fill the region of interest with white color
     cv2.fillPoly(mask, [vertices], ignore_mask_color)
     
+    mask.flags.writeable = False
+    return mask
+
+
+def region_of_interest(img, vertices, dst=None):
+    """Mask the image to only include the region of interest.
+    
+    Args:
+        img: Input image
+        vertices: Array of vertices defining the region of interest
+        dst: Optional preallocated output image to write into
+        
+    Returns:
+        Masked image showing only the region of interest
+    """
+    vertices_bytes = np.ascontiguousarray(vertices, dtype=np.int32).tobytes()
+    mask = _roi_mask(img.shape, img.dtype, vertices_bytes)
+    
     # Apply the mask to the input image
-    masked_image = cv2.bitwise_and(img, mask)
+    masked_image = cv2.bitwise_and(img, mask, dst=dst)
     
     return masked_image
 
 
+@functools.lru_cache(maxsize=8)
+def _roi_umat_mask(shape, vertices_bytes):
+    """Wrap the cached region of interest mask as a UMat for the T-API path."""
+    return cv2.UMat(_roi_mask(shape, np.dtype(np.uint8), vertices_bytes))
+
+
 def get_hough_lines(img, rho=1, theta=np.pi/180, threshold=15, min_line_len=40, max_line_gap=20):
     """Detect lines in the image using Hough transform.
     
@@ -86,8 +160,44 @@ def get_hough_lines(img, rho=1, theta=np.pi/180, threshold=15, min_line_len=40,
     Returns:
         Array of detected line segments
     """
-    return cv2.HoughLinesP(img, rho, theta, threshold, np.array([]), 
-                          minLineLength=min_line_len, maxLineGap=max_line_gap)
+    return cv2.HoughLinesP(img, rho, theta, threshold,
+                           minLineLength=min_line_len, maxLineGap=max_line_gap)
+
+
+@functools.lru_cache(maxsize=4)
+def _fast_line_detector(length_threshold, distance_threshold, do_merge):
+    """Create a FastLineDetector that takes an edge image as input."""
+    if not hasattr(cv2, 'ximgproc'):
+        raise ImportError("cv2.ximgproc is not available; install opencv-contrib-python "
+                          "to use the FastLineDetector")
+    # A zero Canny aperture makes the detector use the input as the edge image
+    return cv2.ximgproc.createFastLineDetector(length_threshold, distance_threshold,
+                                               50.0, 50.0, 0, do_merge)
+
+
+def get_fld_lines(img, length_threshold=40, distance_threshold=1.41421356, do_merge=False):
+    """Detect lines in the image using OpenCV's FastLineDetector.
+    
+    The detector (from opencv-contrib's ximgproc) is created once per
+    parameter set. It returns fewer, longer segments than HoughLinesP for
+    lane markings and has no vote threshold to tune.
+    
+    Args:
+        img: Input edge image
+        length_threshold: Minimum line length
+        distance_threshold: Maximum distance of a point from its segment
+        do_merge: Whether to merge nearby segments
+        
+    Returns:
+        Array of detected line segments shaped like cv2.HoughLinesP output,
+        or None if no lines were found
+    """
+    lines = _fast_line_detector(length_threshold, distance_threshold, do_merge).detect(img)
+    if isinstance(lines, cv2.UMat):
+        lines = lines.get()
+    if lines is None:
+        return None
+    return np.rint(lines).astype(np.int32).reshape(-1, 1, 4)
 
 
 def weighted_img(img, initial_img, α=0.8, β=1., γ=0.):
@@ -96,22 +206,331 @@ def weighted_img(img, initial_img, α=0.8, β=1., γ=0.):
     Args:
         img: First image (colored lanes)
         initial_img: Second image (original frame)
-        α: Weight of the first image
-        β: Weight of the second image
+        α: Weight of the original frame
+        β: Weight of the lanes image
         γ: Scalar added to each sum
         
     Returns:
-        Blended image: img * α + initial_img * β + γ
+        Blended image: initial_img * α + img * β + γ
     """
     return cv2.addWeighted(initial_img, α, img, β, γ)
 
 
-def calculate_lane_lines(lines, image_height):
+# CUDA filters are expensive to create, so they are built once per parameter
+# set and reused across frames. Filters hold internal device buffers, so this
+# shared cache is only for single-threaded use; concurrent callers pass their
+# own cache dict instead.
+_cuda_cache = {}
+
+
+def cuda_available():
+    """Check whether OpenCV was built with CUDA and a device is present.
+    
+    Returns:
+        True if the cv2.cuda pipeline can be used
+    """
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+def _cuda_cached(key, factory, cache=None):
+    """Return the cached CUDA object for key, creating it on first use."""
+    if cache is None:
+        cache = _cuda_cache
+    obj = cache.get(key)
+    if obj is None:
+        obj = cache[key] = factory()
+    return obj
+
+
+def cuda_grayscale(gpu_img):
+    """Convert a GpuMat to grayscale on the GPU.
+    
+    Args:
+        gpu_img: Input image (BGR color space) as cv2.cuda_GpuMat
+        
+    Returns:
+        Grayscale GpuMat
+    """
+    return cv2.cuda.cvtColor(gpu_img, cv2.COLOR_BGR2GRAY)
+
+
+def cuda_gaussian_blur(gpu_img, kernel_size=5, cache=None):
+    """Apply Gaussian blur on the GPU.
+    
+    Args:
+        gpu_img: Input GpuMat
+        kernel_size: Size of Gaussian kernel
+        cache: Optional dict holding the filter instead of the shared cache
+        
+    Returns:
+        Blurred GpuMat
+    """
+    mat_type = gpu_img.type()
+    gaussian = _cuda_cached(
+        ('gaussian', mat_type, kernel_size),
+        lambda: cv2.cuda.createGaussianFilter(mat_type, mat_type, (kernel_size, kernel_size), 0),
+        cache)
+    return gaussian.apply(gpu_img)
+
+
+def cuda_canny(gpu_img, low_threshold=50, high_threshold=150, cache=None):
+    """Apply Canny edge detection on the GPU.
+    
+    Args:
+        gpu_img: Input GpuMat (grayscale)
+        low_threshold: Lower threshold for edge detection
+        high_threshold: Upper threshold for edge detection
+        cache: Optional dict holding the detector instead of the shared cache
+        
+    Returns:
+        GpuMat with detected edges
+    """
+    detector = _cuda_cached(
+        ('canny', low_threshold, high_threshold),
+        lambda: cv2.cuda.createCannyEdgeDetector(low_threshold, high_threshold),
+        cache)
+    return detector.detect(gpu_img)
+
+
+@functools.lru_cache(maxsize=8)
+def _roi_gpu_mask(width, height, vertices_bytes):
+    """Upload the cached region of interest mask for the CUDA path."""
+    gpu_mask = cv2.cuda_GpuMat()
+    gpu_mask.upload(_roi_mask((height, width), np.dtype(np.uint8), vertices_bytes))
+    return gpu_mask
+
+
+def cuda_region_of_interest(gpu_img, vertices):
+    """Mask a GpuMat to only include the region of interest.
+    
+    The mask is rasterized and uploaded once per image size and polygon.
+    
+    Args:
+        gpu_img: Input GpuMat (single channel)
+        vertices: Array of vertices defining the region of interest
+        
+    Returns:
+        Masked GpuMat showing only the region of interest
+    """
+    width, height = gpu_img.size()
+    vertices_bytes = np.ascontiguousarray(vertices, dtype=np.int32).tobytes()
+    gpu_mask = _roi_gpu_mask(width, height, vertices_bytes)
+    return cv2.cuda.bitwise_and(gpu_img, gpu_mask)
+
+
+def cuda_get_hough_lines(gpu_img, rho=1, theta=np.pi/180, threshold=15, min_line_len=40, max_line_gap=20,
+                         cache=None):
+    """Detect lines in a GpuMat using the CUDA Hough segment detector.
+    
+    Args:
+        gpu_img: Input edge GpuMat
+        rho: Distance resolution in pixels
+        theta: Angle resolution in radians
+        threshold: Minimum number of votes
+        min_line_len: Minimum line length
+        max_line_gap: Maximum allowed gap between line segments
+        cache: Optional dict holding the detector instead of the shared cache
+        
+    Returns:
+        Array of detected line segments shaped like cv2.HoughLinesP output,
+        or None if no lines were found
+    """
+    hough = _cuda_cached(
+        ('hough', rho, theta, threshold, min_line_len, max_line_gap),
+        lambda: cv2.cuda.createHoughSegmentDetector(rho, theta, min_line_len, max_line_gap, 4096, threshold),
+        cache)
+    gpu_lines = hough.detect(gpu_img)
+    if gpu_lines.empty():
+        return None
+    return gpu_lines.download().reshape(-1, 1, 4)
+
+
+def find_lane_segments_cuda(img, vertices, kernel_size=5, low_threshold=50, high_threshold=150,
+                            rho=1, theta=np.pi/180, threshold=15, min_line_len=40, max_line_gap=20,
+                            scratch=None):
+    """Run the grayscale -> blur -> Canny -> ROI -> Hough chain on the GPU.
+    
+    The frame is uploaded once and every stage stays in device memory; only
+    the detected line segments are downloaded. Passing the same scratch dict
+    for every frame keeps the device frame buffer ('gpu_frame') and the CUDA
+    filters in it, so each thread running detection needs its own scratch
+    dict. Without one, the filters come from the shared module cache and
+    the chain must only run on one thread.
+    
+    Args:
+        img: Input frame (BGR color space, or grayscale)
+        vertices: Array of vertices defining the region of interest
+        kernel_size: Size of Gaussian kernel
+        low_threshold: Lower threshold for edge detection
+        high_threshold: Upper threshold for edge detection
+        rho: Distance resolution in pixels
+        theta: Angle resolution in radians
+        threshold: Minimum number of votes
+        min_line_len: Minimum line length
+        max_line_gap: Maximum allowed gap between line segments
+        scratch: Optional dict holding the device frame buffer and filters
+        
+    Returns:
+        Array of detected line segments, or None if no lines were found
+    """
+    if not cuda_available():
+        raise RuntimeError("cv2.cuda is not available; OpenCV must be built with CUDA "
+                           "and a CUDA device must be present to use the cuda backend")
+    
+    gpu_frame = _cuda_cached('gpu_frame', cv2.cuda_GpuMat, {} if scratch is None else scratch)
+    gpu_frame.upload(img)
+    
+    gpu_gray = gpu_frame if gpu_frame.channels() == 1 else cuda_grayscale(gpu_frame)
+    gpu_blur = cuda_gaussian_blur(gpu_gray, kernel_size, scratch)
+    gpu_edges = cuda_canny(gpu_blur, low_threshold, high_threshold, scratch)
+    gpu_masked = cuda_region_of_interest(gpu_edges, vertices)
+    
+    return cuda_get_hough_lines(gpu_masked, rho, theta, threshold, min_line_len, max_line_gap, scratch)
+
+
+# Processing backends accepted by find_lane_segments
+BACKENDS = ('numpy', 'umat', 'cuda')
+
+
+def find_lane_segments(img, vertices, backend='numpy', kernel_size=5, low_threshold=50,
+                       high_threshold=150, rho=1, theta=np.pi/180, threshold=15,
+                       min_line_len=40, max_line_gap=20, scratch=None, line_detector='hough'):
+    """Run the grayscale -> blur -> Canny -> ROI -> Hough chain on a frame.
+    
+    With the 'umat' backend the frame is wrapped in a cv2.UMat once, so every
+    stage dispatches to OpenCL (e.g. on an integrated GPU) when available and
+    only the Hough output is copied back. The 'cuda' backend runs the chain
+    through cv2.cuda via find_lane_segments_cuda.
+    
+    On the 'numpy' backend, passing the same scratch dict for every frame of
+    a video keeps the intermediate images ('gray', 'blur', 'edges',
+    'masked') allocated once and written in place through dst=; on the
+    'cuda' backend it holds the device frame buffer and CUDA filters. Use
+    one scratch dict per thread.
+    
+    Args:
+        img: Input frame (BGR color space, or grayscale)
+        vertices: Array of vertices defining the region of interest
+        backend: One of BACKENDS
+        kernel_size: Size of Gaussian kernel
+        low_threshold: Lower threshold for edge detection
+        high_threshold: Upper threshold for edge detection
+        rho: Distance resolution in pixels
+        theta: Angle resolution in radians
+        threshold: Minimum number of votes
+        min_line_len: Minimum line length
+        max_line_gap: Maximum allowed gap between line segments
+        scratch: Optional dict of reusable intermediate buffers
+        line_detector: 'hough' for HoughLinesP or 'fld' for get_fld_lines,
+            which uses min_line_len as its length threshold
+        
+    Returns:
+        Array of detected line segments, or None if no lines were found
+    """
+    if line_detector not in ('hough', 'fld'):
+        raise ValueError(f"Unknown line detector: {line_detector}")
+    if backend == 'cuda':
+        if line_detector != 'hough':
+            raise ValueError("The cuda backend only supports the 'hough' line detector")
+        return find_lane_segments_cuda(img, vertices, kernel_size, low_threshold, high_threshold,
+                                       rho, theta, threshold, min_line_len, max_line_gap, scratch)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    
+    frame = cv2.UMat(img) if backend == 'umat' else img
+    buffers = scratch if scratch is not None and backend == 'numpy' else {}
+    
+    if img.ndim == 2:
+        gray = frame
+    else:
+        gray = buffers['gray'] = grayscale(frame, buffers.get('gray'))
+    blurred = buffers['blur'] = gaussian_blur(gray, kernel_size, buffers.get('blur'))
+    edges = buffers['edges'] = canny(blurred, low_threshold, high_threshold, buffers.get('edges'))
+    
+    if backend == 'umat':
+        vertices_bytes = np.ascontiguousarray(vertices, dtype=np.int32).tobytes()
+        masked = cv2.bitwise_and(edges, _roi_umat_mask(img.shape[:2], vertices_bytes))
+    else:
+        masked = buffers['masked'] = region_of_interest(edges, vertices, buffers.get('masked'))
+    
+    if line_detector == 'fld':
+        return get_fld_lines(masked, min_line_len)
+    
+    lines = get_hough_lines(masked, rho, theta, threshold, min_line_len, max_line_gap)
+    
+    if isinstance(lines, cv2.UMat):
+        lines = lines.get()
+    return lines
+
+
+# Segments whose absolute slope is at or below this are not lane lines
+MIN_LANE_SLOPE = 0.3
+
+
+def _extrapolate_line(slope, intercept, image_height):
+    """Extend an averaged lane line from the bottom of the image upwards.
+    
+    Args:
+        slope: Slope of the lane line
+        intercept: Intercept of the lane line
+        image_height: Height of the original image
+        
+    Returns:
+        Tuple ((x1, y1), (x2, y2)) of the line endpoints
+    """
+    y1 = image_height  # Bottom of the image
+    y2 = int(y1 * 0.6)  # A point higher up (60% from bottom)
+    x1 = int((y1 - intercept) / slope)
+    x2 = int((y2 - intercept) / slope)
+    return ((x1, y1), (x2, y2))
+
+
+def _median_inliers(slopes, group, max_deviation):
+    """Keep only the segments of a lane group whose slope is near its median.
+    
+    Args:
+        slopes: Slopes of all segments
+        group: Boolean mask selecting the segments of one lane
+        max_deviation: Largest allowed distance from the median slope
+        
+    Returns:
+        Boolean mask of the remaining segments
+    """
+    if not group.any():
+        return group
+    median = np.median(slopes[group])
+    return group & (np.abs(slopes - median) <= max_deviation)
+
+
+def _calculate_lane_lines_jit(lines, image_height):
+    """Numba-compiled counterpart of calculate_lane_lines without outlier filtering."""
+    segments = np.ascontiguousarray(np.asarray(lines).reshape(-1, 4), dtype=np.int32)
+    means, counts = _jit.calc_lane_lines_nb(segments, MIN_LANE_SLOPE)
+    
+    left_line = None
+    right_line = None
+    
+    if counts[0]:
+        left_line = _extrapolate_line(means[0], means[1], image_height)
+    
+    if counts[1]:
+        right_line = _extrapolate_line(means[2], means[3], image_height)
+    
+    return left_line, right_line
+
+
+def calculate_lane_lines(lines, image_height, max_slope_deviation=None):
     """Calculate left and right lane lines from a set of line segments.
     
     Args:
         lines: Array of detected line segments
         image_height: Height of the original image
+        max_slope_deviation: If set, segments whose slope is further than
+            this from their lane's median slope are dropped as outliers
+            before averaging
         
     Returns:
         Tuple (left_line, right_line) representing the extrapolated lane lines
@@ -119,43 +538,62 @@ def calculate_lane_lines(lines, image_height):
     if lines is None:
         return None, None
     
-    left_lines = []  # (slope, intercept)
-    right_lines = []  # (slope, intercept)
-    
-    for line in lines:
-        for x1, y1, x2, y2 in line:
-            if x1 == x2:  # Skip vertical lines
-                continue
-            
-            slope = (y2 - y1) / (x2 - x1)
-            intercept = y1 - slope * x1
-            
-            # Categorize lines by slope
-            if slope < -0.3:  # Left line
-                left_lines.append((slope, intercept))
-            elif slope > 0.3:  # Right line
-                right_lines.append((slope, intercept))
+    # For the few dozen segments of a frame, NumPy's per-call overhead
+    # dominates, so use the compiled loop when numba is installed
+    if _jit.HAVE_NUMBA and max_slope_deviation is None:
+        return _calculate_lane_lines_jit(lines, image_height)
+    
+    # Work on all segments at once, stored as structure of arrays: one
+    # contiguous row each for x1, y1, x2 and y2. float32 is ample for pixel
+    # coordinates and keeps every array below in one dtype instead of
+    # promoting to float64 on the divide.
+    coords = np.ascontiguousarray(np.asarray(lines).reshape(-1, 4).T, dtype=np.float32)
+    
+    valid = coords[0] != coords[2]  # Skip vertical lines
+    x1, y1, x2, y2 = coords[:, valid]
+    
+    # Slopes and intercepts share one (2, N) array, so each lane is averaged
+    # with a single reduction over contiguous rows
+    lane_params = np.empty((2, len(x1)), dtype=np.float32)
+    slopes, intercepts = lane_params
+    np.divide(y2 - y1, x2 - x1, out=slopes)
+    np.subtract(y1, slopes * x1, out=intercepts)
+    
+    # Categorize lines by slope
+    left = slopes < -MIN_LANE_SLOPE  # Left line
+    right = slopes > MIN_LANE_SLOPE  # Right line
+    
+    if max_slope_deviation is not None:
+        left = _median_inliers(slopes, left, max_slope_deviation)
+        right = _median_inliers(slopes, right, max_slope_deviation)
     
     # Average out the lines
     left_line = None
     right_line = None
     
-    if left_lines:
-        left_avg = np.average(left_lines, axis=0)
-        slope, intercept = left_avg
-        y1 = image_height  # Bottom of the image
-        y2 = int(y1 * 0.6)  # A point higher up (60% from bottom)
-        x1 = int((y1 - intercept) / slope)
-        x2 = int((y2 - intercept) / slope)
-        left_line = ((x1, y1), (x2, y2))
-    
-    if right_lines:
-        right_avg = np.average(right_lines, axis=0)
-        slope, intercept = right_avg
-        y1 = image_height  # Bottom of the image
-        y2 = int(y1 * 0.6)  # A point higher up (60% from bottom)
-        x1 = int((y1 - intercept) / slope)
-        x2 = int((y2 - intercept) / slope)
-        right_line = ((x1, y1), (x2, y2))
-    
-    return left_line, right_line
\ No newline at end of file
+    if left.any():
+        left_line = _extrapolate_line(*lane_params[:, left].mean(axis=1), image_height)
+    
+    if right.any():
+        right_line = _extrapolate_line(*lane_params[:, right].mean(axis=1), image_height)
+    
+    return left_line, right_line
+
+
+def scale_lane_lines(lane_lines, factor):
+    """Scale lane line endpoints, e.g. back to full resolution after downscale.
+    
+    Args:
+        lane_lines: Tuple (left_line, right_line) from calculate_lane_lines
+        factor: Factor applied to every endpoint coordinate
+        
+    Returns:
+        Tuple (left_line, right_line) with scaled endpoints
+    """
+    scaled = []
+    for line in lane_lines:
+        if line is not None:
+            (x1, y1), (x2, y2) = line
+            line = ((int(x1 * factor), int(y1 * factor)), (int(x2 * factor), int(y2 * factor)))
+        scaled.append(line)
+    return tuple(scaled)
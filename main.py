@@ -1,23 +1,312 @@
 #!/usr/bin/env python
 
 import argparse
+import multiprocessing
+import queue
+import shutil
+import subprocess
+import sys
+import threading
 import cv2
+import numpy as np
 import time
 from lane_detection.detector import LaneDetector
+from lane_detection.tracker import LaneTracker
 from lane_detection.visualizer import LaneVisualizer
 
 
-def process_video(input_path, output_path, visualize=False):
+# Maximum number of frames buffered between pipeline stages
+QUEUE_SIZE = 8
+
+# Number of frames sent to a worker process at a time
+CHUNK_SIZE = 4
+
+# Hardware H.264 encoders tried, in order, when the encoder is 'auto'
+HW_ENCODERS = ('h264_nvenc', 'h264_qsv', 'h264_videotoolbox')
+
+# Sentinel marking the end of the frame stream between pipeline stages
+_END = object()
+
+# Per-process detector and visualizer, created by _init_worker
+_worker_detector = None
+_worker_visualizer = None
+
+
+def _put(q, item, stop):
+    """Put an item on a queue unless the pipeline is shutting down.
+    
+    Returns:
+        bool: True if the item was queued
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    """Get an item from a queue, or _END if the pipeline is shutting down."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _END
+
+
+def _detect_frame(detector, visualizer, frame):
+    """Detect and draw lanes on a single frame.
+    
+    Returns:
+        tuple: (result_frame, processing_time)
+    """
+    # Measure processing time
+    start_time = time.perf_counter()
+    
+    # Detect lanes
+    lanes = detector.detect(frame)
+    
+    # Visualize lanes
+    result_frame = visualizer.draw_lanes(frame, lanes)
+    
+    # Calculate processing time
+    processing_time = time.perf_counter() - start_time
+    
+    return result_frame, processing_time
+
+
+def _run_stage(stage, out_q, stop, errors, *args):
+    """Run a pipeline stage, recording errors and always ending its output."""
+    try:
+        stage(*args, out_q, stop)
+    except Exception as exc:
+        errors.append(exc)
+    finally:
+        _put(out_q, _END, stop)
+
+
+def _read_frames(cap, frames, stop):
+    """Decode frames and queue them as (frame_idx, frame) pairs."""
+    frame_idx = 0
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if not ret or not _put(frames, (frame_idx, frame), stop):
+            break
+        frame_idx += 1
+
+
+def _detect_frames(detector, visualizer, frames, results, stop):
+    """Detect and draw lanes, queueing (frame_idx, result_frame, processing_time)."""
+    while True:
+        item = _get(frames, stop)
+        if item is _END:
+            break
+        frame_idx, frame = item
+        result_frame, processing_time = _detect_frame(detector, visualizer, frame)
+        if not _put(results, (frame_idx, result_frame, processing_time), stop):
+            break
+
+
+def _threaded_results(cap, detector, visualizer):
+    """Yield (frame_idx, result_frame, processing_time) from a threaded pipeline.
+    
+    Decoding and detection run in a reader and a detection thread connected
+    by bounded queues, so they overlap with the caller writing frames. Each
+    stage handles frames in order, so no reordering is needed. OpenCV
+    releases the GIL inside its C++ calls.
+    """
+    stop = threading.Event()
+    errors = []
+    frames = queue.Queue(maxsize=QUEUE_SIZE)
+    results = queue.Queue(maxsize=QUEUE_SIZE)
+    stages = [
+        threading.Thread(target=_run_stage, args=(_read_frames, frames, stop, errors, cap)),
+        threading.Thread(target=_run_stage,
+                         args=(_detect_frames, results, stop, errors, detector, visualizer, frames)),
+    ]
+    
+    try:
+        for stage in stages:
+            stage.start()
+        
+        while True:
+            item = _get(results, stop)
+            if item is _END:
+                break
+            yield item
+        
+        if errors:
+            raise errors[0]
+    
+    finally:
+        stop.set()
+        for stage in stages:
+            if stage.is_alive():
+                stage.join()
+
+
+def _init_worker():
+    """Create the detector and visualizer once per worker process."""
+    global _worker_detector, _worker_visualizer
+    _worker_detector = LaneDetector()
+    _worker_visualizer = LaneVisualizer()
+
+
+def _process_frame(item):
+    """Process one (frame_idx, frame) pair in a worker process."""
+    frame_idx, frame = item
+    result_frame, processing_time = _detect_frame(_worker_detector, _worker_visualizer, frame)
+    return frame_idx, result_frame, processing_time
+
+
+def _iter_frames(cap, slots, stop):
+    """Yield (frame_idx, frame) pairs, waiting for a free slot before each read."""
+    frame_idx = 0
+    while not stop.is_set():
+        if not slots.acquire(timeout=0.1):
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame_idx, frame
+        frame_idx += 1
+
+
+def _pooled_results(cap, workers):
+    """Yield (frame_idx, result_frame, processing_time) from a process pool.
+    
+    Frames are fanned out across worker processes with Pool.imap, which
+    returns results in frame order. The pool reads its input eagerly, so a
+    semaphore bounds how many decoded frames are in flight at once.
+    """
+    stop = threading.Event()
+    slots = threading.Semaphore(2 * workers * CHUNK_SIZE)
+    
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        try:
+            for result in pool.imap(_process_frame, _iter_frames(cap, slots, stop),
+                                    chunksize=CHUNK_SIZE):
+                slots.release()
+                yield result
+        finally:
+            stop.set()
+
+
+class FFmpegWriter:
+    """Video writer that pipes raw BGR frames into an ffmpeg encoder.
+    
+    Exposes the write/release interface of cv2.VideoWriter, so hardware
+    encoders (NVENC, QuickSync, VideoToolbox) can take over encoding from
+    OpenCV's software MPEG-4 writer.
+    """
+    
+    def __init__(self, output_path, fps, frame_size, encoder):
+        """Start the ffmpeg encoder process.
+        
+        Args:
+            output_path (str): Path to save the encoded video
+            fps (float): Frame rate of the video
+            frame_size (tuple): (width, height) of the frames
+            encoder (str): ffmpeg video encoder, e.g. 'h264_nvenc'
+        """
+        width, height = frame_size
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+                   '-r', str(fps), '-i', '-',
+                   '-c:v', encoder, '-pix_fmt', 'yuv420p']
+        if encoder == 'h264_nvenc':
+            command += ['-preset', 'p1']
+        command.append(output_path)
+        # Buffered pipe: BufferedWriter.write keeps writing until the whole
+        # frame is sent, unlike a raw pipe which may accept only part of it
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    
+    def write(self, frame):
+        """Send a BGR frame to the encoder."""
+        self._process.stdin.write(np.ascontiguousarray(frame).data)
+    
+    def release(self):
+        """Finish encoding and wait for ffmpeg to exit."""
+        if self._process.stdin.closed:
+            return
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise IOError(f"ffmpeg exited with status {self._process.returncode}")
+
+
+def _encoder_works(encoder):
+    """Check that ffmpeg can actually encode a frame with the given encoder."""
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+               '-f', 'lavfi', '-i', 'color=size=256x256', '-frames:v', '1',
+               '-c:v', encoder, '-f', 'null', '-']
+    return subprocess.run(command, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+def _select_hw_encoder():
+    """Find a working hardware H.264 encoder, or None if there is none."""
+    if shutil.which('ffmpeg') is None:
+        return None
+    
+    encoders = list(HW_ENCODERS)
+    if sys.platform == 'darwin':
+        encoders.sort(key=lambda encoder: encoder != 'h264_videotoolbox')
+    
+    for encoder in encoders:
+        if _encoder_works(encoder):
+            return encoder
+    return None
+
+
+def create_writer(output_path, fps, frame_size, encoder='auto'):
+    """Create the video writer for the processed frames.
+    
+    Args:
+        output_path (str): Path to save processed video
+        fps (float): Frame rate of the video
+        frame_size (tuple): (width, height) of the frames
+        encoder (str): 'auto' to use a hardware encoder through ffmpeg when
+            one works, 'opencv' for cv2.VideoWriter, or an ffmpeg encoder name
+    
+    Returns:
+        Writer with write(frame) and release() methods
+    """
+    if encoder == 'auto':
+        encoder = _select_hw_encoder() or 'opencv'
+    
+    if encoder == 'opencv':
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # codec
+        return cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+    
+    if shutil.which('ffmpeg') is None:
+        raise IOError(f"Encoder '{encoder}' needs ffmpeg, which was not found on PATH; "
+                      "install ffmpeg or use --encoder opencv")
+    
+    return FFmpegWriter(output_path, fps, frame_size, encoder)
+
+
+def process_video(input_path, output_path, visualize=False, workers=1, encoder='auto',
+                  detect_every=1, roi_vertices=None):
     """Process a video file for lane detection.
     
     Args:
         input_path (str): Path to input video file
         output_path (str): Path to save processed video
         visualize (bool): Whether to display processing in a window
+        workers (int): Number of detection processes; 1 runs detection in
+            a thread of this process
+        encoder (str): Video encoder, see create_writer
+        detect_every (int): Run full lane detection once every this many
+            frames and reuse the lanes in between (threaded pipeline only)
+        roi_vertices: Optional region of interest polygon for the scene
+            change check of detect_every; without it the check measures
+            edge density over the whole frame
     """
-    # Initialize detector and visualizer
-    detector = LaneDetector()
-    visualizer = LaneVisualizer()
+    if workers > 1 and detect_every > 1:
+        raise ValueError("detect_every needs frames in order and cannot be combined with workers")
     
     # Open video file
     cap = cv2.VideoCapture(input_path)
@@ -30,30 +319,27 @@ def process_video(input_path, output_path, visualize=False):
     fps = cap.get(cv2.CAP_PROP_FPS)
     
     # Initialize video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # codec
-    writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    writer = create_writer(output_path, fps, (width, height), encoder)
+    
+    # Detect lanes in worker processes, or in a detection thread feeding
+    # this (main) thread, which writes and displays the frames
+    if workers > 1:
+        results = _pooled_results(cap, workers)
+    else:
+        detector = LaneTracker(LaneDetector().detect, detect_every, roi_vertices)
+        results = _threaded_results(cap, detector, LaneVisualizer())
     
+    # Preallocate per-frame timings; the frame count reported by some
+    # containers is missing or inexact, so the buffer still grows on demand
     frame_count = 0
-    processing_times = []
+    processing_times = np.empty(max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0) or 100000,
+                                dtype=np.float32)
     
     try:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Measure processing time
-            start_time = time.time()
-            
-            # Detect lanes
-            lanes = detector.detect(frame)
-            
-            # Visualize lanes
-            result_frame = visualizer.draw_lanes(frame, lanes)
-            
-            # Calculate processing time
-            processing_time = time.time() - start_time
-            processing_times.append(processing_time)
+        for _, result_frame, processing_time in results:
+            if frame_count == len(processing_times):
+                processing_times = np.resize(processing_times, 2 * frame_count)
+            processing_times[frame_count] = processing_time
             
             # Write frame to output video
             writer.write(result_frame)
@@ -63,20 +349,21 @@ def process_video(input_path, output_path, visualize=False):
                 cv2.imshow('Lane Detection', result_frame)
                 if cv2.waitKey(1) & 0xFF == ord('q'):
                     break
-                    
+            
             frame_count += 1
             if frame_count % 100 == 0:
                 print(f"Processed {frame_count} frames")
     
     finally:
-        # Release resources
+        # Stop the pipeline and release resources
+        results.close()
         cap.release()
         writer.release()
         cv2.destroyAllWindows()
         
         # Print performance stats
-        if processing_times:
-            avg_time = sum(processing_times) / len(processing_times)
+        if frame_count:
+            avg_time = processing_times[:frame_count].mean()
             print(f"Processed {frame_count} frames")
             print(f"Average processing time: {avg_time:.4f} seconds per frame")
             print(f"Average FPS: {1/avg_time:.2f}")
@@ -87,16 +374,27 @@ def main():
     parser.add_argument('--input', '-i', required=True, help='Path to input video file')
     parser.add_argument('--output', '-o', required=True, help='Path to output video file')
     parser.add_argument('--visualize', '-v', action='store_true', help='Visualize processing')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of detection processes (default: 1)')
+    parser.add_argument('--encoder', '-e', default='auto',
+                        help="'auto' for a hardware encoder via ffmpeg when available, "
+                             "'opencv' for OpenCV's writer, or an ffmpeg encoder name "
+                             "(default: auto)")
+    parser.add_argument('--detect-every', '-k', type=int, default=1,
+                        help='Run lane detection once every K frames and reuse '
+                             'the lanes in between; a frame-wide edge density check '
+                             'forces detection on scene changes (default: 1)')
     
     args = parser.parse_args()
     
     print(f"Processing video: {args.input}")
     print(f"Output will be saved to: {args.output}")
     
-    process_video(args.input, args.output, args.visualize)
+    process_video(args.input, args.output, args.visualize, args.workers, args.encoder,
+                  args.detect_every)
     
     print("Processing complete!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,67 @@
 from setuptools import setup, find_packages
+from setuptools.command.build_ext import build_ext
+
+try:
+    from setuptools.errors import CCompilerError, ExecError, PlatformError
+except ImportError:
+    from distutils.errors import (CCompilerError, DistutilsExecError as ExecError,
+                                  DistutilsPlatformError as PlatformError)
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+
+class OptionalBuildExt(build_ext):
+    """Build the Cython extension, falling back to pure Python on failure."""
+
+    def initialize_options(self):
+        super().initialize_options()
+        self._skipped = set()
+
+    def run(self):
+        try:
+            super().run()
+        except PlatformError as exc:
+            self._warn(exc)
+
+    def build_extension(self, ext):
+        try:
+            super().build_extension(ext)
+        except (CCompilerError, ExecError, PlatformError) as exc:
+            self._skipped.add(ext.name)
+            self._warn(exc)
+
+    def copy_extensions_to_source(self):
+        self.extensions = [ext for ext in self.extensions if ext.name not in self._skipped]
+        super().copy_extensions_to_source()
+
+    def get_outputs(self):
+        self.extensions = [ext for ext in self.extensions if ext.name not in self._skipped]
+        return super().get_outputs()
+
+    def _warn(self, exc):
+        print(f"WARNING: could not compile the Cython extension ({exc}); "
+              "using the pure Python lane_detection.utils")
+
+
+# When Cython and a C compiler are available at build time, utils.py (the
+# per-frame chain) is compiled to a C extension to cut interpreter overhead
+# in its glue code; otherwise the pure Python module is installed unchanged.
+ext_modules = []
+if cythonize is not None:
+    ext_modules = cythonize(
+        ["lane_detection/utils.py"],
+        compiler_directives={"language_level": 3},
+    )
 
 setup(
     name="lane_detection",
     version="1.0.0",
     packages=find_packages(),
+    ext_modules=ext_modules,
+    cmdclass={"build_ext": OptionalBuildExt},
     install_requires=[
         "numpy>=1.19.0",
         "opencv-python>=4.5.0",
@@ -11,6 +69,9 @@ setup(
         "scipy>=1.7.0",
         "pillow>=8.2.0",
     ],
+    extras_require={
+        "jit": ["numba>=0.50"],
+    },
     author="Your Name",
     author_email="your.email@example.com",
     description="Lane detection system for road videos",
@@ -0,0 +1,124 @@
+"""Tests for the frame pipelines in main.py."""
+
+import importlib
+import multiprocessing
+import sys
+import threading
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+FRAME_SIZE = (64, 48)
+FRAME_COUNT = 40
+# Frames brighter than this make the stub detector fail
+FAIL_LEVEL = 200
+
+
+class StubDetector:
+    """Detector stand-in that fails on bright frames."""
+    
+    def detect(self, frame):
+        if frame.mean() > FAIL_LEVEL:
+            raise RuntimeError('detection failed')
+        return None
+
+
+class StubVisualizer:
+    """Visualizer stand-in that returns the frame unchanged."""
+    
+    def draw_lanes(self, frame, lanes):
+        return frame
+
+
+@pytest.fixture
+def main(monkeypatch):
+    """Import main.py with the stub detector and visualizer modules."""
+    detector = types.ModuleType('lane_detection.detector')
+    detector.LaneDetector = StubDetector
+    visualizer = types.ModuleType('lane_detection.visualizer')
+    visualizer.LaneVisualizer = StubVisualizer
+    monkeypatch.setitem(sys.modules, 'lane_detection.detector', detector)
+    monkeypatch.setitem(sys.modules, 'lane_detection.visualizer', visualizer)
+    monkeypatch.delitem(sys.modules, 'main', raising=False)
+    return importlib.import_module('main')
+
+
+def _write_video(path, levels):
+    """Write a video of flat gray frames, one per brightness level."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 30, FRAME_SIZE)
+    assert writer.isOpened()
+    for level in levels:
+        writer.write(np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), level, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def video(tmp_path):
+    return _write_video(tmp_path / 'ramp.avi', [4 * i for i in range(FRAME_COUNT)])
+
+
+@pytest.fixture
+def failing_video(tmp_path):
+    levels = [4 * i for i in range(FRAME_COUNT)]
+    levels[FRAME_COUNT // 2] = 255
+    return _write_video(tmp_path / 'failing.avi', levels)
+
+
+@pytest.fixture
+def pool_results(main):
+    if multiprocessing.get_start_method() != 'fork':
+        pytest.skip('worker processes only see the stub modules when forked')
+    return lambda cap: main._pooled_results(cap, workers=2)
+
+
+@pytest.fixture(params=['threaded', 'pooled'])
+def results(request, main):
+    """Both frame pipelines, as a callable taking a VideoCapture."""
+    if request.param == 'threaded':
+        return lambda cap: main._threaded_results(cap, StubDetector(), StubVisualizer())
+    return request.getfixturevalue('pool_results')
+
+
+def _close_in_thread(gen, timeout=10):
+    """Close a generator on a helper thread; return False if it hangs."""
+    closer = threading.Thread(target=gen.close, daemon=True)
+    closer.start()
+    closer.join(timeout)
+    return not closer.is_alive()
+
+
+def test_results_keep_frame_order(results, video):
+    cap = cv2.VideoCapture(str(video))
+    try:
+        items = list(results(cap))
+    finally:
+        cap.release()
+    
+    assert [frame_idx for frame_idx, _, _ in items] == list(range(FRAME_COUNT))
+    means = [result_frame.mean() for _, result_frame, _ in items]
+    assert means == sorted(means)
+    assert all(processing_time >= 0 for _, _, processing_time in items)
+
+
+def test_results_reraise_detector_errors(results, failing_video):
+    cap = cv2.VideoCapture(str(failing_video))
+    try:
+        with pytest.raises(RuntimeError, match='detection failed'):
+            for _ in results(cap):
+                pass
+    finally:
+        cap.release()
+
+
+def test_results_close_after_partial_read(results, video):
+    cap = cv2.VideoCapture(str(video))
+    try:
+        gen = results(cap)
+        for _ in range(3):
+            next(gen)
+        assert _close_in_thread(gen)
+    finally:
+        cap.release()
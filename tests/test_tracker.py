@@ -0,0 +1,60 @@
+"""Tests for lane_detection.tracker."""
+
+import numpy as np
+
+from lane_detection.tracker import LaneTracker
+
+
+class CountingDetect:
+    """Stub detect callable that records the frames it was called on."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def __call__(self, frame):
+        self.calls.append(frame)
+        return len(self.calls)
+
+
+def _striped_frame():
+    # Bands wide enough to keep their edges at the tracker's check scale
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    frame[(np.arange(240) // 16) % 2 == 1] = 255
+    return frame
+
+
+def _blank_frame():
+    return np.zeros((240, 320, 3), dtype=np.uint8)
+
+
+def test_detects_once_per_interval():
+    detect = CountingDetect()
+    tracker = LaneTracker(detect, interval=3)
+    frame = _striped_frame()
+    
+    lanes = [tracker.detect(frame) for _ in range(7)]
+    
+    assert len(detect.calls) == 3
+    assert lanes == [1, 1, 1, 2, 2, 2, 3]
+
+
+def test_scene_change_forces_detection():
+    detect = CountingDetect()
+    tracker = LaneTracker(detect, interval=10)
+    
+    tracker.detect(_striped_frame())
+    tracker.detect(_striped_frame())
+    assert len(detect.calls) == 1
+    
+    assert tracker.detect(_blank_frame()) == 2
+    assert len(detect.calls) == 2
+
+
+def test_interval_one_detects_every_frame():
+    detect = CountingDetect()
+    tracker = LaneTracker(detect, interval=1)
+    frame = _striped_frame()
+    
+    lanes = [tracker.detect(frame) for _ in range(5)]
+    
+    assert lanes == [1, 2, 3, 4, 5]
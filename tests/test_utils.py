@@ -0,0 +1,56 @@
+"""Tests for lane_detection.utils."""
+
+import numpy as np
+import pytest
+
+from lane_detection import _jit, utils
+
+IMAGE_HEIGHT = 540
+
+
+def _numpy_lane_lines(monkeypatch, lines):
+    """Run calculate_lane_lines with the numba path disabled."""
+    with monkeypatch.context() as m:
+        m.setattr(_jit, 'HAVE_NUMBA', False)
+        return utils.calculate_lane_lines(lines, IMAGE_HEIGHT)
+
+
+def _random_segments(rng, count):
+    """Random HoughLinesP-style segments of shape (count, 1, 4)."""
+    return rng.integers(0, 960, size=(count, 1, 4), dtype=np.int32)
+
+
+@pytest.fixture
+def jit():
+    pytest.importorskip('numba')
+    assert _jit.HAVE_NUMBA
+    return utils._calculate_lane_lines_jit
+
+
+def test_calculate_lane_lines_none():
+    assert utils.calculate_lane_lines(None, IMAGE_HEIGHT) == (None, None)
+
+
+def test_jit_matches_numpy_on_empty_input(jit, monkeypatch):
+    lines = np.empty((0, 1, 4), dtype=np.int32)
+    assert jit(lines, IMAGE_HEIGHT) == (None, None)
+    assert _numpy_lane_lines(monkeypatch, lines) == (None, None)
+
+
+@pytest.mark.parametrize('shape', [(-1, 4), (-1, 1, 4)])
+def test_jit_matches_numpy(jit, monkeypatch, shape):
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        lines = _random_segments(rng, rng.integers(1, 60)).reshape(shape)
+        assert jit(lines, IMAGE_HEIGHT) == _numpy_lane_lines(monkeypatch, lines)
+
+
+def test_jit_skips_vertical_and_flat_segments(jit, monkeypatch):
+    lines = np.array([[100, 500, 100, 300],   # vertical
+                      [100, 400, 600, 410],   # too flat
+                      [100, 500, 300, 300],   # left
+                      [600, 300, 800, 500]],  # right
+                     dtype=np.int32)
+    left, right = jit(lines, IMAGE_HEIGHT)
+    assert left is not None and right is not None
+    assert (left, right) == _numpy_lane_lines(monkeypatch, lines)